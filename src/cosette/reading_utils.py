@@ -1,7 +1,17 @@
+import os
 import re
+from functools import lru_cache
 
 import numpy as np
 
+# Splits a CLASS header line such as '1:l  2:TT' into column names
+_CLASS_HDR_RE = re.compile(r"\d+:")
+
+# Bin-dependent spectra that read_sfx_class_cls_file can select
+_BIN_CL_NAMES = frozenset(
+    {"dd", "ll", "ii", "dl", "di", "il", "td", "dd_auto", "ll_auto", "ii_auto"}
+)
+
 
 def read_class_file_headers(file_path):
     """
@@ -21,24 +31,22 @@ def read_class_file_headers(file_path):
         ValueError: If no headers (lines starting with '#') are found in the file.
     """
     try:
-        headers = []
+        last_header = None
 
         with open(file_path, "r") as file:
             for line in file:
-                line = line.strip()
+                line = line.lstrip()
                 if line.startswith("#"):
-                    headers.append(
-                        line[1:].strip()
-                    )  # Remove the # and any leading/trailing whitespace
+                    last_header = line[1:]  # Only the last header line is needed
                 else:
                     break  # Stop reading when we encounter a non-header line
 
-        if not headers:
+        if last_header is None:
             raise ValueError(f"No headers found in file: {file_path}")
 
         # Process the last header line to get column names
         # Split the last string by number and colon pattern
-        parts = re.split(r"\d+:", headers[-1])
+        parts = _CLASS_HDR_RE.split(last_header)
 
         # Remove empty strings and strip whitespace
         column_headers = [part.strip() for part in parts if part.strip()]
@@ -49,13 +57,24 @@ def read_class_file_headers(file_path):
         raise FileNotFoundError(f"File not found: {file_path}")
 
 
-def read_sfx_class_cls_file(nbins, cl_filepath):
+def read_sfx_class_cls_file(nbins, cl_filepath, select=None, cache=False):
     """
     Reads the angular power spectra from an sfx_class output file and returns them as a dictionary.
 
+    Two on-disk layouts are supported: the legacy .npz holding a single pickled
+    dictionary under 'all_cl', and a plain .npz with one array per spectrum
+    (e.g. 'd0d1'), whose arrays are only read from disk when accessed.
+
     Args:
         nbins (int): The number of bins.
         cl_filepath (str): The file path to the file.
+        select (iterable of str, optional): Names of the bin-dependent spectra to read
+            (e.g. {'dd', 'll'}). The others are skipped and left out of the result.
+            If None, all of them are read.
+        cache (bool): If True, keep the result in memory for the last few files read,
+            and reuse it as long as the file is not modified. The cached arrays are
+            shared between calls and read-only: copy them before modifying them.
+            Defaults to False, which always returns freshly read, writable arrays.
 
     Returns:
         dict: A dictionary containing the SHCs for different power spectra, including:
@@ -66,9 +85,203 @@ def read_sfx_class_cls_file(nbins, cl_filepath):
             'dd_auto', 'll_auto', 'ii_auto': The auto power spectra for density, lensing, and cosmic infrared background.
             - 'dd', 'll', 'ii': The cross-correlations between redshift bins for for density, lensing, and intrinsic alignment.
             - td', 'dl', 'di', 'il': The cross-correlation power spectra for density-temperature, density-lensing, density-IA, and lensing-IA.
+
+        'dd', 'll', 'ii', 'dl', 'di' and 'il' are arrays of shape (nbins, nbins, n_ell),
+        indexed as cls[bin1, bin2] or cls[bin1][bin2]. 'dd', 'll' and 'ii' are symmetric
+        in the two bins. 'dd_auto', 'll_auto' and 'ii_auto' are arrays of shape
+        (nbins, n_ell), indexed as cls[bin1]. These arrays keep the floating point
+        dtype of the spectra in the file. 'td' is still a dict of spectra keyed by bin.
+
+        Compared to the nested dicts returned by earlier versions:
+            - Iterating over cls['dd'][bin1] yields the spectra (rows), not the bin
+              indices; use range(nbins) to loop over bins.
+            - Missing intrinsic alignment spectra are NaN instead of None. 'ii', 'di',
+              'il' and 'ii_auto' are None only if the file has no intrinsic alignment
+              spectra at all.
+
+    Raises:
+        TypeError: If select is a single string instead of a collection of names.
+        ValueError: If select contains names other than 'dd', 'll', 'ii', 'dl', 'di',
+            'il', 'td', 'dd_auto', 'll_auto' and 'ii_auto'.
+    """
+    if select is not None:
+        if isinstance(select, str):
+            raise TypeError(
+                f"select must be a collection of spectrum names, not the string {select!r}"
+            )
+        select = frozenset(select)
+        unknown = select - _BIN_CL_NAMES
+        if unknown:
+            raise ValueError(
+                f"Unknown spectra in select: {sorted(unknown)}. "
+                f"Valid names are: {sorted(_BIN_CL_NAMES)}"
+            )
+
+    if not cache:
+        return _load_sfx_class_cls_file(nbins, cl_filepath, select)
+
+    cl_filepath = os.path.abspath(cl_filepath)
+    stat = os.stat(cl_filepath)
+
+    dict_cl = _read_sfx_class_cls_file_cached(
+        nbins, cl_filepath, stat.st_mtime_ns, stat.st_size, select
+    )
+
+    # Fresh containers, so callers cannot alter the cached result
+    return {
+        name: dict(cls) if isinstance(cls, dict) else cls
+        for name, cls in dict_cl.items()
+    }
+
+
+def convert_sfx_class_cls_file(nbins, cl_filepath, output_filepath):
+    """
+    Converts a legacy sfx_class output file, holding a pickled 'all_cl' dictionary,
+    to an .npz with one array per spectrum, which read_sfx_class_cls_file loads
+    lazily and without pickle.
+
+    The auto spectra are also saved stacked, as (nbins, n_ell) arrays under
+    'dd_auto_stack', 'll_auto_stack' and 'ii_auto_stack', so that they are read
+    in a single access.
+
+    Args:
+        nbins (int): The number of bins.
+        cl_filepath (str): The file path to the legacy file.
+        output_filepath (str): The file path of the converted file.
+    """
+    with np.load(cl_filepath, allow_pickle=True) as cl_file:
+        all_cl = cl_file["all_cl"].item()
+
+    arrays = {key: np.asarray(cl) for key, cl in all_cl.items() if cl is not None}
+
+    for tracer in "dli":
+        keys = _bin_pair_keys(tracer, tracer, nbins)
+        auto_keys = [keys[bin1][bin1] for bin1 in range(nbins)]
+        if all(key in arrays for key in auto_keys):
+            arrays[f"{tracer}{tracer}_auto_stack"] = np.stack(
+                [arrays[key] for key in auto_keys]
+            )
+
+    np.savez(output_filepath, **arrays)
+
+
+@lru_cache(maxsize=8)
+def _read_sfx_class_cls_file_cached(nbins, cl_filepath, mtime_ns, size, select):
+    """
+    Cached version of _load_sfx_class_cls_file, with read-only arrays. The
+    modification time and size of the file are part of the cache key, so that a
+    rewritten file is read again.
+    """
+    dict_cl = _load_sfx_class_cls_file(nbins, cl_filepath, select)
+
+    for cls in dict_cl.values():
+        for cl in cls.values() if isinstance(cls, dict) else [cls]:
+            if isinstance(cl, np.ndarray):
+                cl.setflags(write=False)
+
+    return dict_cl
+
+
+def _load_sfx_class_cls_file(nbins, cl_filepath, select):
+    """
+    Read an sfx_class Cl file in either of the supported layouts.
+    """
+    with np.load(cl_filepath) as cl_file:
+        if "all_cl" in cl_file.files:
+            # Legacy format: everything is pickled in a single dictionary,
+            # the only case in which unpickling is allowed
+            with np.load(cl_filepath, allow_pickle=True) as legacy_file:
+                all_cl = legacy_file["all_cl"].item()
+        else:
+            # One array per key: NpzFile reads each member lazily on access
+            all_cl = cl_file
+
+        return _collect_sfx_class_cls(nbins, all_cl, select)
+
+
+@lru_cache(maxsize=None)
+def _bin_pair_keys(tracer1, tracer2, nbins):
+    """
+    Table of the all_cl keys for a pair of tracers, e.g. keys[0][1] == 'd0l1'.
+    """
+    return tuple(
+        tuple(f"{tracer1}{bin1}{tracer2}{bin2}" for bin2 in range(nbins))
+        for bin1 in range(nbins)
+    )
+
+
+def _nan_dtype(cl):
+    """
+    dtype of a stacking buffer for spectra like cl: the dtype of cl itself if it
+    can hold NaN (so float32 spectra stay float32), otherwise a float type.
+    """
+    return np.promote_types(np.asarray(cl).dtype, np.float16)
+
+
+def _stack_bins(get_cl, keys):
+    """
+    Gather one spectrum per bin into an array of shape (nbins, n_ell).
+
+    get_cl maps a key to its spectrum, or to None for an optional missing spectrum.
+    Missing spectra are filled with NaN, and None is returned when none are found.
+    """
+    nbins = len(keys)
+    cls = None
+
+    for bin1, key in enumerate(keys):
+        cl = get_cl(key)
+        if cl is None:
+            continue
+        if cls is None:
+            cls = np.full((nbins, len(cl)), np.nan, dtype=_nan_dtype(cl))
+        cls[bin1] = cl
+
+    return cls
+
+
+def _stack_bin_pairs(get_cl, keys, symmetric=False):
+    """
+    Gather the spectra of a tracer pair into one array of shape (nbins, nbins, n_ell),
+    so that cls[bin1, bin2] (or cls[bin1][bin2]) is the spectrum of that bin pair.
+
+    get_cl maps a key to its spectrum, or to None for an optional missing spectrum.
+    For symmetric pairs only the upper triangle is read and mirrored to the lower one.
+    Missing spectra are filled with NaN, and None is returned when none are found.
     """
-    all_cl = np.load(cl_filepath, allow_pickle=True)["all_cl"].item()
-    all_cl.keys()
+    nbins = len(keys)
+    cls = None
+
+    for bin1 in range(nbins):
+        for bin2 in range(bin1 if symmetric else 0, nbins):
+            cl = get_cl(keys[bin1][bin2])
+            if cl is None:
+                continue
+            if cls is None:
+                cls = np.full((nbins, nbins, len(cl)), np.nan, dtype=_nan_dtype(cl))
+            cls[bin1, bin2] = cl
+            if symmetric:
+                cls[bin2, bin1] = cl
+
+    return cls
+
+
+def _collect_sfx_class_cls(nbins, all_cl, select):
+    """
+    Assemble the dictionary returned by read_sfx_class_cls_file from the
+    mapping of spectra stored in the file.
+    """
+
+    def wanted(name):
+        return select is None or name in select
+
+    # Build the key set once, so each optional spectrum costs one set lookup
+    available = frozenset(all_cl)
+
+    def get_required(key):
+        return all_cl[key]
+
+    def get_optional(key):
+        return all_cl[key] if key in available else None
 
     l = all_cl["ell1"]
     lls = all_cl["ell2"]
@@ -80,38 +293,51 @@ def read_sfx_class_cls_file(nbins, cl_filepath):
     ep = all_cl["ep"]
 
     td = {}
-    dd_auto = {}
-    ll_auto = {}
-    ii_auto = {}
-    dd = {}
-    ll = {}
-    ii = {}
-    dl = {}
-    di = {}
-    il = {}
+
+    dd_keys = _bin_pair_keys("d", "d", nbins)
+    ll_keys = _bin_pair_keys("l", "l", nbins)
+    ii_keys = _bin_pair_keys("i", "i", nbins)
+    dl_keys = _bin_pair_keys("d", "l", nbins)
+    di_keys = _bin_pair_keys("d", "i", nbins)
+    il_keys = _bin_pair_keys("i", "l", nbins)
 
     for bin1 in range(nbins):
-        dd[bin1] = {}
-        ll[bin1] = {}
-        ii[bin1] = {}
-        dl[bin1] = {}
-        di[bin1] = {}
-        il[bin1] = {}
-
-        td[bin1] = all_cl["td" + str(bin1)]
-        dd_auto[bin1] = all_cl[("d" + str(bin1)) * 2]
-        ll_auto[bin1] = all_cl[("l" + str(bin1)) * 2]
-        ii_auto[bin1] = all_cl.get(("i" + str(bin1)) * 2)
-
-        for bin2 in range(bin1, nbins):
-            dd[bin1][bin2] = all_cl["d" + str(bin1) + "d" + str(bin2)]
-            ll[bin1][bin2] = all_cl["l" + str(bin1) + "l" + str(bin2)]
-            ii[bin1][bin2] = all_cl.get("i" + str(bin1) + "i" + str(bin2))
-
-        for bin2 in range(nbins):
-            dl[bin1][bin2] = all_cl["d" + str(bin1) + "l" + str(bin2)]
-            di[bin1][bin2] = all_cl.get("d" + str(bin1) + "i" + str(bin2))
-            il[bin1][bin2] = all_cl.get("i" + str(bin1) + "l" + str(bin2))
+        if wanted("td"):
+            td[bin1] = all_cl[f"td{bin1}"]
+
+    def auto_cls(name, get_cl, keys):
+        # Converted files store the auto spectra already stacked. If the stack
+        # has fewer than nbins rows, read the per-bin keys instead, so that
+        # missing bins are handled as in the per-key layout
+        stacked = get_optional(f"{name}_stack")
+        if stacked is not None and len(stacked) >= nbins:
+            return stacked[:nbins]
+        return _stack_bins(get_cl, [keys[bin1][bin1] for bin1 in range(nbins)])
+
+    # Auto spectra, as (nbins, n_ell) arrays
+    dd_auto = auto_cls("dd_auto", get_required, dd_keys) if wanted("dd_auto") else None
+    ll_auto = auto_cls("ll_auto", get_required, ll_keys) if wanted("ll_auto") else None
+    ii_auto = auto_cls("ii_auto", get_optional, ii_keys) if wanted("ii_auto") else None
+
+    # Bin-pair spectra, as (nbins, nbins, n_ell) arrays
+    dd = (
+        _stack_bin_pairs(get_required, dd_keys, symmetric=True)
+        if wanted("dd")
+        else None
+    )
+    ll = (
+        _stack_bin_pairs(get_required, ll_keys, symmetric=True)
+        if wanted("ll")
+        else None
+    )
+    ii = (
+        _stack_bin_pairs(get_optional, ii_keys, symmetric=True)
+        if wanted("ii")
+        else None
+    )
+    dl = _stack_bin_pairs(get_required, dl_keys) if wanted("dl") else None
+    di = _stack_bin_pairs(get_optional, di_keys) if wanted("di") else None
+    il = _stack_bin_pairs(get_optional, il_keys) if wanted("il") else None
 
     dict_cl = {
         "l": l,
@@ -122,6 +348,9 @@ def read_sfx_class_cls_file(nbins, cl_filepath):
         "pp": pp,
         "tp": tp,
         "ep": ep,
+    }
+
+    bin_cls = {
         "dd": dd,
         "ll": ll,
         "ii": ii,
@@ -133,5 +362,6 @@ def read_sfx_class_cls_file(nbins, cl_filepath):
         "di": di,
         "il": il,
     }
+    dict_cl.update({name: cls for name, cls in bin_cls.items() if wanted(name)})
 
     return dict_cl
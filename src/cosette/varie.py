@@ -16,25 +16,213 @@ Note: More functions may be added to this module as the project evolves.
 
 import glob
 import json
+import mmap
 import os
 import shutil
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 
+# Read size used when scanning and copying large chain files
+_CHUNK_SIZE = 1 << 20
+
+_LATEX_DICT = {
+    "w0": r"w_0",
+    "wa": r"w_{\rm a}",
+    "ob": r"\Omega_{\rm b}",
+    "om": r"\Omega_{\rm m}",
+    "sigma8": r"\sigma_8",
+    "tau": r"\tau",
+    "ns": r"n_{\rm s}",
+    "h": r"h",
+    "delta_IG": r"\Delta",
+    "Delta": r"\Delta",
+    "gamma_IG": r"\xi",
+    "mnu": r"\sum m_{\nu} \rm [eV]",
+    "aIA": r"{\cal A}_{\rm IA}",
+    "eIA": r"\eta_{\rm IA}",
+    "bIA": r"\beta_{\rm IA}",
+}
+_LATEX_DICT.update({f"b{i}": rf"b_{{{i}}}" for i in range(14)})
+_LATEX_DICT.update({f"bM{i}": rf"b_{{\rm M, {i}}}" for i in range(14)})
+_LATEX_DICT.update({f"m{i}": rf"m_{{{i}}}" for i in range(14)})
+
+
+@lru_cache(maxsize=1)
+def _load_params_lists():
+    """
+    Load params_lists.json once and cache it as a dict of tuples, so that
+    callers cannot mutate the cached lists.
+    """
+    project_root = Path(__file__).parent.parent.parent
+    constants_lists_file_path = project_root / "params_lists.json"
+    with open(constants_lists_file_path, "r", encoding="utf-8") as file:
+        constants_lists = json.load(file)
+
+    return {key: tuple(value) for key, value in constants_lists.items()}
+
+
+def _advise_sequential(f):
+    """
+    Hint the kernel that f will be read sequentially, where supported.
+    """
+    if hasattr(os, "posix_fadvise"):
+        os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+
+
+def _count_lines(file_path):
+    """
+    Count the lines of a file the same way readlines() would, scanning it in
+    binary chunks instead of decoding every line.
+    """
+    n_lines = 0
+    last_byte = b"\n"
+    with open(file_path, "rb") as f:
+        _advise_sequential(f)
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b""):
+            n_lines += chunk.count(b"\n")
+            last_byte = chunk[-1:]
+
+    # A trailing line without newline still counts as a line
+    if last_byte != b"\n":
+        n_lines += 1
+
+    return n_lines
+
+
+def _line_offsets(file_path, line_numbers):
+    """
+    Return the byte offsets at which the given (0-based) lines start.
+    Lines past the end of the file are mapped to the file size.
+    """
+    pending = sorted(set(line_numbers))
+    offsets = {}
+    n_newlines = 0
+    pos = 0
+
+    # Line 0 always starts at the beginning of the file
+    while pending and pending[0] <= 0:
+        offsets[pending.pop(0)] = 0
+
+    with open(file_path, "rb") as f:
+        _advise_sequential(f)
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b""):
+            if not pending:
+                break
+
+            chunk_newlines = chunk.count(b"\n")
+            if n_newlines + chunk_newlines < pending[0]:
+                # None of the requested lines start in this chunk
+                n_newlines += chunk_newlines
+                pos += len(chunk)
+                continue
+
+            idx = chunk.find(b"\n")
+            while idx != -1 and pending:
+                n_newlines += 1
+                if n_newlines == pending[0]:
+                    offsets[pending.pop(0)] = pos + idx + 1
+                idx = chunk.find(b"\n", idx + 1)
+
+            if idx != -1:
+                n_newlines += chunk.count(b"\n", idx)
+            pos += len(chunk)
+
+    for line in pending:
+        offsets[line] = pos
+
+    return [offsets[line] for line in line_numbers]
+
+
+def _copy_byte_range(src, dst, start_byte, end_byte):
+    """
+    Append bytes [start_byte, end_byte) of the open binary file src to dst.
+    """
+    _advise_sequential(src)
+    remaining = end_byte - start_byte
+
+    if sys.platform.startswith("linux"):
+        # Copy in kernel space, without going through Python buffers
+        dst.flush()
+        offset = start_byte
+        try:
+            while remaining > 0:
+                sent = os.sendfile(
+                    dst.fileno(), src.fileno(), offset, min(remaining, _CHUNK_SIZE)
+                )
+                if sent == 0:
+                    break
+                offset += sent
+                remaining -= sent
+            return
+        except OSError:
+            # sendfile not supported for these files (e.g. EINVAL, ENOSYS):
+            # fall back to the read/write loop if nothing was copied yet
+            if offset != start_byte:
+                raise
+
+    src.seek(start_byte)
+    while remaining > 0:
+        chunk = src.read(min(remaining, _CHUNK_SIZE))
+        if not chunk:
+            break
+        dst.write(chunk)
+        remaining -= len(chunk)
+
+
+def _rewrite_byte_ranges(file_path, byte_ranges, output_path=None):
+    """
+    Write the concatenation of the given [start, end) byte ranges of file_path
+    to output_path, or replace file_path itself if output_path is None.
+
+    The ranges go to a temporary file next to the output, which is then moved
+    over it, so the source is never truncated before it has been read.
+    """
+    in_place = output_path is None
+    if in_place:
+        output_path = file_path
+
+    tmp_path = f"{output_path}.tmp"
+    try:
+        with open(file_path, "rb") as src, open(tmp_path, "wb") as dst:
+            for start_byte, end_byte in byte_ranges:
+                _copy_byte_range(src, dst, start_byte, end_byte)
+        if in_place:
+            shutil.copymode(file_path, tmp_path)
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        # Do not leave a half-written temporary file behind
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+@lru_cache(maxsize=None)
+def _find_classy_path(cosmo_directory):
+    """
+    Locate the classy build folder inside a CLASS installation.
+    """
+    build_directory = os.path.join(cosmo_directory, "python", "build")
+    with os.scandir(build_directory) as entries:
+        for entry in entries:
+            if "lib." in entry.name:
+                return entry.path
+
+    raise FileNotFoundError(f"No classy build found in {build_directory}")
+
 
 def find_classy(cosmo_directory):
     """
     Finds and imports the CLASS library.
     """
 
-    for elem in os.listdir(os.path.join(cosmo_directory, "python", "build")):
-        if elem.find("lib.") != -1:
-            classy_path = os.path.join(cosmo_directory, "python", "build", elem)
-            break
+    classy_path = _find_classy_path(cosmo_directory)
 
     # Inserting the previously found path into the list of folders to
-    # search for python modules.
-    sys.path.insert(1, classy_path)
+    # search for python modules, unless it is already there.
+    if classy_path not in sys.path:
+        sys.path.insert(1, classy_path)
 
 
 def latex_pnames(pnames):
@@ -53,28 +241,7 @@ def latex_pnames(pnames):
     Returns:
         list: A new list with the LaTeX representations of the input parameter names.
     """
-    latex_dict = {
-        "w0": r"w_0",
-        "wa": r"w_{\rm a}",
-        "ob": r"\Omega_{\rm b}",
-        "om": r"\Omega_{\rm m}",
-        "sigma8": r"\sigma_8",
-        "tau": r"\tau",
-        "ns": r"n_{\rm s}",
-        "h": r"h",
-        "delta_IG": r"\Delta",
-        "Delta": r"\Delta",
-        "gamma_IG": r"\xi",
-        "mnu": r"\sum m_{\nu} \rm [eV]",
-        "aIA": r"{\cal A}_{\rm IA}",
-        "eIA": r"\eta_{\rm IA}",
-        "bIA": r"\beta_{\rm IA}",
-    }
-    latex_dict.update({f"b{i}": rf"b_{{{i}}}" for i in range(14)})
-    latex_dict.update({f"bM{i}": rf"b_{{\rm M, {i}}}" for i in range(14)})
-    latex_dict.update({f"m{i}": rf"m_{{{i}}}" for i in range(14)})
-
-    return [latex_dict.get(p, p) for p in pnames]
+    return [_LATEX_DICT.get(p, p) for p in pnames]
 
 
 def exclude_nuisance(
@@ -98,18 +265,15 @@ def exclude_nuisance(
         str: the type of parameters that were excluded ('cosmo' or 'nuisance').
     """
 
-    project_root = Path(__file__).parent.parent.parent
-    constants_lists_file_path = project_root / "params_lists.json"
-    with open(constants_lists_file_path, "r", encoding="utf-8") as file:
-        constants_lists = json.load(file)
+    constants_lists = _load_params_lists()
 
     cosmo_list = constants_lists["cosmo"]
-    nuisance_list = constants_lists["nuisance"]
+    nuisance_list = list(constants_lists["nuisance"])
     all_but_shear_bias_list = constants_lists["all_but_shear_bias"]
     shear_bias_list = constants_lists["shear_bias"]
 
     if only_shear_bias:
-        exclude = all_but_shear_bias_list
+        exclude = list(all_but_shear_bias_list)
         partype = "nuisance"
     elif excl_nuis is True:
         if mnu is True:
@@ -120,9 +284,9 @@ def exclude_nuisance(
         partype = "cosmo"
     else:
         if nuis_without_shear_bias:
-            exclude = cosmo_list + shear_bias_list
+            exclude = list(cosmo_list) + list(shear_bias_list)
         else:
-            exclude = cosmo_list
+            exclude = list(cosmo_list)
         partype = "nuisance"
 
     return exclude, partype
@@ -142,29 +306,41 @@ def delete_burn_in(folder, file, burn_in):
     The modified data is then written back to the original files.
     """
 
-    folder = "emg_cc_P18_desi_wideV0"
     file_pattern = os.path.join(folder, file + ".*.txt")
     files = glob.glob(file_pattern)
 
     for file_path in files:
-        # Read the file
-        with open(file_path, "r") as f:
-            lines = f.readlines()
+        total_lines = _count_lines(file_path)
+
+        # Keep the header (first line) and drop the first burn_in
+        # fraction of the remaining lines
+        cut = max(int((total_lines - 1) * burn_in), 0)
+        header_end, start_byte = _line_offsets(file_path, [1, 1 + cut])
+        file_size = os.path.getsize(file_path)
+
+        _rewrite_byte_ranges(file_path, [(0, header_end), (start_byte, file_size)])
 
-        # Keep the header (first line)
-        header = lines[0]
 
-        # Get remaining lines and calculate middle point
-        remaining_lines = lines[1:]
-        point_forward = len(remaining_lines) * burn_in
+def _find_last_hash_line_end(mm):
+    """
+    Return the byte offset just past the last line of mm whose first non-blank
+    character is '#', or -1 if there is no such line.
+    """
+    search_end = len(mm)
+    while True:
+        hash_pos = mm.rfind(b"#", 0, search_end)
+        if hash_pos == -1:
+            return -1
 
-        # Keep only second part of remaining lines
-        selected_lines = remaining_lines[point_forward - 1 :]
+        line_start = mm.rfind(b"\n", 0, hash_pos) + 1
+        line_end = mm.find(b"\n", hash_pos)
+        line_end = len(mm) if line_end == -1 else line_end + 1
 
-        # Write back to file
-        with open(file_path, "w") as f:
-            f.write(header)  # Write header first
-            f.writelines(selected_lines)  # Write selected lines
+        if mm[line_start:line_end].lstrip().startswith(b"#"):
+            return line_end
+
+        # The '#' is not at the start of its line, look at the previous lines
+        search_end = line_start
 
 
 def delete_before_last_hash_line(file_path):
@@ -174,24 +350,48 @@ def delete_before_last_hash_line(file_path):
     Args:
         file_path (str): Path to the file to be processed.
     """
-    with open(file_path, "r") as f:
-        lines = f.readlines()
+    file_size = os.path.getsize(file_path)
+    if file_size == 0:
+        return
 
-    # Find the last line index that starts with '#'
-    last_hash_index = -1
-    for i, line in enumerate(lines):
-        if line.lstrip().startswith("#"):
-            last_hash_index = i
+    # Search backwards from the end of the file for the last '#' line,
+    # letting mmap.rfind scan the bytes in C instead of iterating over lines
+    with open(file_path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            last_hash_end = _find_last_hash_line_end(mm)
 
     # If no '#' line found, do nothing
-    if last_hash_index == -1:
+    if last_hash_end == -1:
         return
 
     # Remove everything up to and including the last '#' line
-    remaining = lines[last_hash_index + 1 :]
+    _rewrite_byte_ranges(file_path, [(last_hash_end, file_size)])
+
+
+def _cut_one(file_path, output_path, start_frac, end_frac):
+    """
+    Write the lines of file_path between the start_frac and end_frac fractions
+    of the file to output_path. Return the first and last line numbers, and the
+    number of lines actually written.
+    """
+    total_lines = _count_lines(file_path)
 
-    with open(file_path, "w") as f:
-        f.writelines(remaining)
+    # Calculate which lines to keep based on percentages
+    start_line = int(total_lines * start_frac)
+    end_line = int(total_lines * end_frac)
+
+    # Locate the byte range of the desired portion
+    start_byte, end_byte = _line_offsets(file_path, [start_line, end_line])
+
+    # Write the cut content, trimming in place if the output is the input file
+    if os.path.exists(output_path) and os.path.samefile(file_path, output_path):
+        _rewrite_byte_ranges(file_path, [(start_byte, end_byte)])
+    else:
+        _rewrite_byte_ranges(file_path, [(start_byte, end_byte)], output_path)
+
+    kept_lines = max(min(end_line, total_lines) - start_line, 0)
+
+    return start_line, end_line, kept_lines
 
 
 def cut_files_by_percentage(
@@ -223,44 +423,38 @@ def cut_files_by_percentage(
         source_path = os.path.join(folder_path, additional_file)
         if os.path.exists(source_path):
             dest_path = os.path.join(output_folder, additional_file)
+            if os.path.exists(dest_path) and os.path.samefile(source_path, dest_path):
+                continue  # Trimming in place, nothing to copy
             shutil.copy2(source_path, dest_path)
             print(f"Copied {additional_file}")
         else:
             print(f"Warning: {additional_file} not found in {folder_path}")
 
     # Find all files matching the pattern prefix_*.txt
-    pattern = os.path.join(folder_path, f"{prefix}_*.txt")
-    files = glob.glob(pattern)
-
-    # Sort files to maintain order
-    files.sort(key=lambda x: int(x.split("_")[-1].split(".")[0]))
-
-    for file_path in files:
-        # Extract the file number from filename
-        filename = os.path.basename(file_path)
-        file_number = filename.split("_")[-1].split(".")[0]
-
-        # Read the original file
-        with open(file_path, "r") as f:
-            lines = f.readlines()
-
-        total_lines = len(lines)
-
-        # Calculate which lines to keep based on percentages
-        start_line = int(total_lines * start_frac)
-        end_line = int(total_lines * end_frac)
-
-        # Extract the desired portion
-        cut_lines = lines[start_line:end_line]
-
-        # Create output filename
-        output_filename = f"{prefix}_{file_number}.txt"
-        output_path = os.path.join(output_folder, output_filename)
-
-        # Write the cut content to new file
-        with open(output_path, "w") as f:
-            f.writelines(cut_lines)
-
-        print(
-            f"Processed {filename}: kept lines {start_line} to {end_line} ({len(cut_lines)} lines)"
+    paths = Path(folder_path).glob(f"{prefix}_*.txt")
+
+    # Sort files by number to maintain order, parsing each number only once
+    numbered_files = []
+    for path in paths:
+        file_number = path.stem.rsplit("_", 1)[1]
+        numbered_files.append((int(file_number), file_number, path))
+    numbered_files.sort()
+
+    output_paths = [
+        os.path.join(output_folder, f"{prefix}_{file_number}.txt")
+        for _, file_number, _ in numbered_files
+    ]
+    file_paths = [file_path for _, _, file_path in numbered_files]
+
+    # Files are independent and the work is I/O bound, so cut them in parallel
+    with ThreadPoolExecutor(max_workers=min(8, len(file_paths)) or 1) as executor:
+        results = executor.map(
+            lambda paths: _cut_one(*paths, start_frac, end_frac),
+            zip(file_paths, output_paths),
         )
+
+        # Results come back in file order, so the log is not interleaved
+        for file_path, (start_line, end_line, kept_lines) in zip(file_paths, results):
+            print(
+                f"Processed {file_path.name}: kept lines {start_line} to {end_line} ({kept_lines} lines)"
+            )